@@ -1,12 +1,19 @@
-import os
-import aiohttp
-import asyncio
 import time
+_SCRIPT_IMPORT_START = time.perf_counter()
+
+import os
+import sys
 import json
+import math
+import importlib
 from collections import defaultdict, Counter
+from functools import lru_cache
 import re
 from datetime import datetime, timedelta
 from typing import Dict, Iterable, List, Optional, Set, Tuple, Any
+from urllib.parse import urlsplit
+
+# aiohttp / asyncio 等重量级模块按子命令懒加载，见文末 COMMAND_MODULES
 
 # ==================== 原代码中的动态关键词过滤 ====================
 def get_dynamic_keywords():
@@ -29,7 +36,11 @@ CHAR_NORMALIZATION_MAP = str.maketrans({
     "滬": "沪", "閩": "闽", "贛": "赣", "蘇": "苏", "浙": "浙", "魯": "鲁",
     "豫": "豫", "鄂": "鄂", "湘": "湘", "粵": "粤", "瓊": "琼", "渝": "渝",
     "遼": "辽", "寧": "宁", "貴": "贵", "雲": "云", "藏": "藏", "陝": "陕",
-    "晉": "晋", "冀": "冀", "錫": "锡",
+    "晉": "晋", "冀": "冀", "錫": "锡", "東": "东", "門": "门", "華": "华",
+    "國": "国", "兒": "儿", "訊": "讯", "遊": "游", "會": "会", "實": "实",
+    "軍": "军", "動": "动", "購": "购", "戲": "戏", "聯": "联", "鳳": "凤",
+    "風": "风", "亞": "亚", "歐": "欧", "際": "际", "線": "线", "資": "资",
+    "漢": "汉", "內": "内", "農": "农", "財": "财", "車": "车",
 })
 
 def normalize_text_for_match(text: str) -> str:
@@ -72,10 +83,13 @@ NON_GEO_TOKENS = {
     "HD", "SD", "UHD", "FHD", "4K", "8K",
 }
 
-COMMON_CHANNEL_SUFFIXES_NORMALIZED = tuple(
-    sorted({normalize_text_for_match(s) for s in COMMON_CHANNEL_SUFFIXES}, key=len, reverse=True)
-)
-NON_GEO_TOKENS_NORMALIZED = {normalize_text_for_match(token) for token in NON_GEO_TOKENS}
+@lru_cache(maxsize=None)
+def get_common_channel_suffixes_normalized() -> Tuple[str, ...]:
+    return tuple(sorted({normalize_text_for_match(s) for s in COMMON_CHANNEL_SUFFIXES}, key=len, reverse=True))
+
+@lru_cache(maxsize=None)
+def get_non_geo_tokens_normalized() -> frozenset:
+    return frozenset(normalize_text_for_match(token) for token in NON_GEO_TOKENS)
 
 PROVINCE_SUFFIXES = ("特别行政区", "维吾尔自治区", "壮族自治区", "回族自治区", "自治区", "省", "市")
 AREA_SUFFIXES = ("自治县", "自治州", "自治区", "特别行政区", "新区", "开发区", "高新区",
@@ -83,8 +97,12 @@ AREA_SUFFIXES = ("自治县", "自治州", "自治区", "特别行政区", "新
 IGNORED_GEO_NAMES = {"市辖区", "城区", "郊区", "新区", "开发区", "高新区", "矿区", "城区街道",
                      "其他", "直辖", "省直辖县级行政区划", "自治区直辖县级行政区划",
                      "市辖县", "县级市", "直辖县级", "工业园区", "示范区", "合作区", "管理区"}
-IGNORED_GEO_NAMES_NORMALIZED = {normalize_text_for_match(name) for name in IGNORED_GEO_NAMES}
 
+@lru_cache(maxsize=None)
+def get_ignored_geo_names_normalized() -> frozenset:
+    return frozenset(normalize_text_for_match(name) for name in IGNORED_GEO_NAMES)
+
+GEO_INDEX_VERSION = 1
 ONLINE_GEO_DATA_URLS = [
     "https://raw.githubusercontent.com/modood/Administrative-divisions-of-China/master/dist/pca-code.json",
     "https://fastly.jsdelivr.net/gh/modood/Administrative-divisions-of-China/dist/pca-code.json",
@@ -96,7 +114,10 @@ BLOCKED_M3U_KEYWORDS = (
     "免费订阅", "免費訂閲", "免費訂閱", "温馨提示", "溫馨提示", "建議使用", "建议使用",
     "请勿贩卖", "請勿販賣", "请勿频繁切换", "請勿頻繁切換", "个人觀看", "個人觀看", "刀刀影院"
 )
-BLOCKED_M3U_KEYWORDS_NORMALIZED = tuple(normalize_text_for_match(kw) for kw in BLOCKED_M3U_KEYWORDS)
+
+@lru_cache(maxsize=None)
+def get_blocked_m3u_keywords_normalized() -> Tuple[str, ...]:
+    return tuple(normalize_text_for_match(kw) for kw in BLOCKED_M3U_KEYWORDS)
 
 CHANNEL_NAME_MARKERS = (
     "卫视", "衛視", "频道", "頻道", "台", "TV", "CCTV", "CGTN", "CHC",
@@ -123,7 +144,7 @@ def strip_common_channel_suffixes(token: str) -> str:
     changed = True
     while changed and value:
         changed = False
-        for suffix in COMMON_CHANNEL_SUFFIXES_NORMALIZED:
+        for suffix in get_common_channel_suffixes_normalized():
             if value.endswith(suffix) and len(value) > len(suffix) + 1:
                 value = value[:-len(suffix)]
                 changed = True
@@ -145,12 +166,16 @@ def extract_geo_tokens(channel_name: str, normalized_aliases: Set[str]) -> Set[s
                 trimmed = trimmed[len(alias):]
                 break
         trimmed = strip_common_channel_suffixes(trimmed).strip()
-        if 2 <= len(trimmed) <= 8 and trimmed not in NON_GEO_TOKENS_NORMALIZED:
+        if 2 <= len(trimmed) <= 8 and trimmed not in get_non_geo_tokens_normalized():
             tokens.add(trimmed)
     return tokens
 
+@lru_cache(maxsize=None)
+def get_suffixes_by_length(suffixes: Tuple[str, ...]) -> Tuple[str, ...]:
+    return tuple(sorted(suffixes, key=len, reverse=True))
+
 def strip_suffix_once(name: str, suffixes: Iterable[str]) -> str:
-    for suffix in sorted(suffixes, key=len, reverse=True):
+    for suffix in get_suffixes_by_length(tuple(suffixes)):
         if name.endswith(suffix) and len(name) > len(suffix) + 1:
             return name[:-len(suffix)]
     return name
@@ -166,7 +191,7 @@ def geo_name_variants(name: str) -> Set[str]:
     stripped = strip_suffix_once(cleaned, AREA_SUFFIXES)
     if stripped and stripped != cleaned:
         variants.add(stripped)
-    return {v for v in variants if len(v) >= 2 and normalize_text_for_match(v) not in IGNORED_GEO_NAMES_NORMALIZED}
+    return {v for v in variants if len(v) >= 2 and normalize_text_for_match(v) not in get_ignored_geo_names_normalized()}
 
 def iter_named_items(payload) -> Iterable[str]:
     if isinstance(payload, list):
@@ -201,9 +226,7 @@ def build_province_lookup(province_channels: Dict[str, Set[str]]) -> Dict[str, s
                 lookup[normalized] = province_key
     return lookup
 
-def collect_online_geo_tokens(geo_payload, province_channels: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
-    province_lookup = build_province_lookup(province_channels)
-    added_tokens = defaultdict(set)
+def iter_province_nodes(geo_payload) -> List[Dict[str, Any]]:
     if isinstance(geo_payload, list):
         province_nodes = geo_payload
     elif isinstance(geo_payload, dict):
@@ -212,41 +235,112 @@ def collect_online_geo_tokens(geo_payload, province_channels: Dict[str, Set[str]
         else:
             province_nodes = [{"name": key, "children": value} for key, value in geo_payload.items() if isinstance(value, (list, dict))]
     else:
-        return added_tokens
-    for node in province_nodes:
-        if not isinstance(node, dict):
-            continue
+        return []
+    return [node for node in province_nodes if isinstance(node, dict)]
+
+def resolve_province_key(province_normalized: str, province_lookup: Dict[str, str]) -> Optional[str]:
+    province_key = province_lookup.get(province_normalized)
+    if not province_key:
+        for key, matched_province in province_lookup.items():
+            if key and (key in province_normalized or province_normalized in key):
+                province_key = matched_province
+                break
+    return province_key
+
+def build_geo_token_index(geo_payload, province_channels: Dict[str, Set[str]],
+                          province_index: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, Any]:
+    """
+    遍历全国行政区划树，生成版本化的省份→地名 token 索引：
+    province_index 为数据集省名（归一化）到省份分组的精确匹配表（未匹配记为 null），tokens 为每个省份排好序的 token 列表。
+    传入上次缓存的 province_index 时先做哈希精确查找，只有新出现的省名才走子串回退。
+    """
+    province_lookup = build_province_lookup(province_channels)
+    province_index = dict(province_index or {})
+    added_tokens = defaultdict(set)
+    for node in iter_province_nodes(geo_payload):
         province_name = node.get("name")
         if not isinstance(province_name, str) or not province_name.strip():
             continue
         province_normalized = normalize_text_for_match(normalize_province_name(province_name))
-        province_key = province_lookup.get(province_normalized)
-        if not province_key:
-            for key, matched_province in province_lookup.items():
-                if key and (key in province_normalized or province_normalized in key):
-                    province_key = matched_province
-                    break
+        if province_normalized not in province_index:
+            province_index[province_normalized] = resolve_province_key(province_normalized, province_lookup)
+        province_key = province_index[province_normalized]
         if not province_key:
             continue
         for raw_name in iter_named_items(node.get("children", [])):
             for variant in geo_name_variants(raw_name):
                 normalized_variant = normalize_text_for_match(variant)
-                if len(normalized_variant) >= 2 and normalized_variant not in IGNORED_GEO_NAMES_NORMALIZED:
+                if len(normalized_variant) >= 2 and normalized_variant not in get_ignored_geo_names_normalized():
                     added_tokens[province_key].add(variant)
-    return added_tokens
+    return {
+        "version": GEO_INDEX_VERSION,
+        "province_index": dict(sorted(province_index.items())),
+        "tokens": {province: sorted(tokens) for province, tokens in sorted(added_tokens.items())},
+    }
+
+def collect_online_geo_tokens(geo_payload, province_channels: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
+    index = build_geo_token_index(geo_payload, province_channels)
+    return defaultdict(set, {province: set(tokens) for province, tokens in index["tokens"].items()})
+
+def geo_index_fingerprint(province_channels: Dict[str, Set[str]]) -> str:
+    """索引依赖的省份分组与归一化规则的摘要；任一变化都会使缓存失效"""
+    import hashlib
 
-async def load_online_geo_tokens(session: aiohttp.ClientSession, province_channels: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
+    rules = [
+        GEO_INDEX_VERSION,
+        sorted(province_channels),
+        sorted((name, sorted(aliases)) for name, aliases in PROVINCE_ALIASES.items()),
+        PROVINCE_SUFFIXES,
+        AREA_SUFFIXES,
+        sorted(IGNORED_GEO_NAMES),
+        sorted(CHAR_NORMALIZATION_MAP.items()),
+    ]
+    return hashlib.sha256(json.dumps(rules, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def load_geo_token_index(file_path: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+    """读取与当前规则摘要一致的缓存索引；数据集哈希由调用方比较"""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(index, dict) or index.get("version") != GEO_INDEX_VERSION:
+        return None
+    if index.get("fingerprint") != fingerprint or not isinstance(index.get("province_index"), dict):
+        return None
+    return index
+
+def save_geo_token_index(file_path: str, index: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+
+async def load_online_geo_tokens(session: "aiohttp.ClientSession", province_channels: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
+    """下载行政区划数据；数据集哈希与规则摘要命中缓存时直接加载索引，不再遍历整棵树"""
+    import hashlib
+
+    fingerprint = geo_index_fingerprint(province_channels)
     for url in ONLINE_GEO_DATA_URLS:
         try:
             async with session.get(url, timeout=10) as response:
                 if response.status != 200:
                     continue
-                raw_text = await response.text(errors="ignore")
-                payload = json.loads(raw_text)
-                tokens = collect_online_geo_tokens(payload, province_channels)
+                raw_bytes = await response.read()
+                dataset_hash = hashlib.sha256(raw_bytes).hexdigest()
+                index = load_geo_token_index(CONFIG["geo_index_cache"], fingerprint)
+                cached = index is not None and index.get("dataset_hash") == dataset_hash
+                if not cached:
+                    # 数据集有变化：重新遍历，但省名解析沿用上次的精确匹配表
+                    payload = json.loads(raw_bytes.decode(response.get_encoding(), errors="ignore"))
+                    seed = index["province_index"] if index else None
+                    index = build_geo_token_index(payload, province_channels, seed)
+                    index.update(dataset_hash=dataset_hash, fingerprint=fingerprint)
+                    if index["tokens"]:
+                        save_geo_token_index(CONFIG["geo_index_cache"], index)
+                tokens = {province: set(items) for province, items in index["tokens"].items()}
                 if tokens:
                     total = sum(len(items) for items in tokens.values())
-                    print(f"Loaded {total} online geo tokens from: {url}")
+                    print(f"Loaded {total} online geo tokens from: {url}{' (cached index)' if cached else ''}")
                     return tokens
         except Exception:
             continue
@@ -296,7 +390,7 @@ def looks_like_notice_entry(channel: str, source_group_title: Optional[str] = No
         if any(kw.casefold() in lowered for kw in BLOCKED_M3U_KEYWORDS):
             return True
         normalized = normalize_text_for_match(raw_text)
-        if normalized and any(kw in normalized for kw in BLOCKED_M3U_KEYWORDS_NORMALIZED):
+        if normalized and any(kw in normalized for kw in get_blocked_m3u_keywords_normalized()):
             return True
     return False
 
@@ -444,6 +538,267 @@ def deduplicate_candidate_entries(entries):
         dedup.append(e)
     return dedup
 
+# ==================== 频道聚类（跨源合并同名变体，共享 URL 池） ====================
+CCTV_CLUSTER_PATTERN = re.compile(
+    r"^(CCTV(?:4K|8K|\d+\+?))(?:综合|新闻|财经|综艺|体育赛事|体育|电影|电视剧|戏曲|音乐|科教|少儿|纪录|农业农村|国防军事|社会与法)?"
+)
+CLUSTER_DECORATIVE_SUFFIXES = ("频道", "頻道", "电视台", "電視台", "直播", "高清", "超清", "标清")
+CLUSTER_QUALITY_TAGS = r"(?:IPV6|HEVC|H265|H264|HDR|UHD|FHD|HD|SD|\d{3,4}P)"
+CLUSTER_QUALITY_TAIL_PATTERN = re.compile(CLUSTER_QUALITY_TAGS + r"+$")
+CLUSTER_QUALITY_TAG_PATTERN = re.compile(CLUSTER_QUALITY_TAGS)
+# 4K/8K 是独立的频道（见 📛4K·8K频道），作为签名的一部分保留；前面是字母时（CCTV4K）属于台名本身
+CLUSTER_RESOLUTION_PATTERN = re.compile(r"(?<![0-9A-Za-z])([48])K(?![0-9A-Za-z])", re.IGNORECASE)
+CLUSTER_PARENTHETICAL_PATTERN = re.compile(r"[（(【\[]([^\])）】]{0,24})[)）】\]]")
+CLUSTER_TRAILING_MARKERS = ("台", "剧", "片")
+CLUSTER_SIGNATURE_NUMERALS = set("〇一二三四五六七八九十")
+CLUSTER_MAX_EDIT_DISTANCE = 1
+CLUSTER_MIN_FUZZY_LENGTH = 3
+CLUSTER_MAX_BLOCK_SIZE = 64
+
+@lru_cache(maxsize=None)
+def get_cluster_decorative_suffixes_normalized() -> Tuple[str, ...]:
+    return tuple(sorted({normalize_text_for_match(s) for s in CLUSTER_DECORATIVE_SUFFIXES}, key=len, reverse=True))
+
+def strip_cluster_decorations(text: str) -> str:
+    for suffix in get_cluster_decorative_suffixes_normalized():
+        text = text.replace(suffix, "")
+    return text
+
+def _keep_informative_parenthetical(match) -> str:
+    """括号内只有清晰度/修饰词时丢弃；地区、线路等（新加坡、原声线路）保留为名称的一部分"""
+    content = match.group(1)
+    if not CLUSTER_QUALITY_TAG_PATTERN.sub("", strip_cluster_decorations(normalize_text_for_match(content))):
+        return ""
+    return content
+
+def split_channel_cluster_key(channel_name: str) -> Tuple[str, str]:
+    """
+    将频道名归约为（主体, 后缀区）：繁简/符号/清晰度统一，仅去掉后缀区的修饰词，保留编号、4K/8K 与内容词。
+    主体即 strip_common_channel_suffixes 后的地名/台名部分，模糊合并只允许发生在后缀区。
+    """
+    name = normalize_cctv_name(channel_name)
+    resolution = "".join(f"{digit}K" for digit in CLUSTER_RESOLUTION_PATTERN.findall(name))
+    name = CLUSTER_RESOLUTION_PATTERN.sub("", name)
+    name = CLUSTER_PARENTHETICAL_PATTERN.sub(_keep_informative_parenthetical, name)
+    normalized = normalize_text_for_match(name)
+    if not normalized:
+        return resolution, ""
+    cctv_match = CCTV_CLUSTER_PATTERN.match(normalized)
+    if cctv_match:
+        base, tail = cctv_match.group(1), normalized[cctv_match.end():]
+    else:
+        normalized = CLUSTER_QUALITY_TAIL_PATTERN.sub("", normalized) or normalized
+        marker = ""
+        if len(normalized) > 2 and normalized.endswith(CLUSTER_TRAILING_MARKERS):
+            normalized, marker = normalized[:-1], normalized[-1]
+        base = strip_common_channel_suffixes(normalized)
+        if not base or not normalized.startswith(base):
+            base = normalized
+        tail = normalized[len(base):] + marker
+    tail = CLUSTER_QUALITY_TAIL_PATTERN.sub("", strip_cluster_decorations(tail))
+    return base, tail + resolution
+
+def channel_cluster_key(channel_name: str) -> str:
+    return "".join(split_channel_cluster_key(channel_name))
+
+def cluster_key_signature(key: str) -> str:
+    """非汉字部分（编号、字母、+、4K）与汉字数字必须完全一致才允许模糊合并，避免 CCTV5/CCTV5+、汕头一台/汕头台 误并"""
+    return "".join(ch for ch in key if not "一" <= ch <= "鿿" or ch in CLUSTER_SIGNATURE_NUMERALS)
+
+def within_indel_distance(a: str, b: str, limit: int) -> bool:
+    """带状 DP 的有界编辑距离（仅插入/删除）；不计替换，广东/广西 这类单字差异不会被合并"""
+    if abs(len(a) - len(b)) > limit:
+        return False
+    if a == b:
+        return True
+    inf = limit + 1
+    previous = [j if j <= limit else inf for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        current = [inf] * (len(b) + 1)
+        current[0] = i if i <= limit else inf
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            if a[i - 1] == b[j - 1]:
+                current[j] = previous[j - 1]
+            else:
+                current[j] = min(previous[j], current[j - 1]) + 1
+        if min(current) > limit:
+            return False
+        previous = current
+    return previous[len(b)] <= limit
+
+def cluster_channel_names(channel_names: Iterable[str], preferred_names: Optional[Set[str]] = None,
+                          stats: Optional[Dict[str, int]] = None) -> Dict[str, str]:
+    """
+    将频道名变体聚成簇，返回 {原名: 簇代表名}。
+    先按聚类键精确归并，再以（签名, 二元组）分块；块内先要求主体（地名部分）完全相同，
+    再对后缀区做有界编辑距离校验。超过 CLUSTER_MAX_BLOCK_SIZE 的块跳过并计入 stats["skipped_blocks"]，
+    整体开销随不同名称数近似线性增长，不做全量两两比较。
+    """
+    preferred = {normalize_cctv_name(name) for name in (preferred_names or ())}
+    name_counts = Counter(channel_names)
+    key_members = defaultdict(list)
+    key_parts = {}
+    for name in name_counts:
+        base, tail = split_channel_cluster_key(name)
+        key = base + tail
+        if key:
+            key_members[key].append(name)
+            key_parts.setdefault(key, (base, tail))
+
+    keys = sorted(key_members)
+    parent = {key: key for key in keys}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    blocks = defaultdict(list)
+    for key in keys:
+        if len(key) < CLUSTER_MIN_FUZZY_LENGTH:
+            continue
+        signature = cluster_key_signature(key)
+        for bigram in {key[i:i + 2] for i in range(len(key) - 1)}:
+            blocks[(signature, bigram)].append(key)
+
+    skipped_blocks = 0
+    for members in blocks.values():
+        if len(members) < 2:
+            continue
+        if len(members) > CLUSTER_MAX_BLOCK_SIZE:
+            skipped_blocks += 1
+            continue
+        for i, left in enumerate(members):
+            for right in members[i + 1:]:
+                if key_parts[left][0] != key_parts[right][0]:
+                    continue
+                root_left, root_right = find(left), find(right)
+                if root_left == root_right:
+                    continue
+                if within_indel_distance(key_parts[left][1], key_parts[right][1], CLUSTER_MAX_EDIT_DISTANCE):
+                    parent[max(root_left, root_right)] = min(root_left, root_right)
+
+    clusters = defaultdict(list)
+    for key in keys:
+        clusters[find(key)].extend(key_members[key])
+
+    mapping = {}
+    for names in clusters.values():
+        representative = min(names, key=lambda n: (normalize_cctv_name(n) not in preferred, -name_counts[n], len(n), n))
+        for name in names:
+            mapping[name] = representative
+    if stats is not None:
+        stats["skipped_blocks"] = skipped_blocks
+    return mapping
+
+def merge_channel_clusters(entries, preferred_names: Optional[Set[str]] = None):
+    """将同簇变体统一改名为代表名，使其 URL 并入同一频道，随后按频道名+URL 再去重"""
+    stats = {}
+    mapping = cluster_channel_names((e["channel"] for e in entries), preferred_names, stats)
+    merged = []
+    seen = set()
+    for e in entries:
+        ch = mapping.get(e["channel"], e["channel"])
+        key = (normalize_text_for_match(ch), e["url"])
+        if key in seen:
+            continue
+        seen.add(key)
+        e["channel"] = ch
+        merged.append(e)
+    print(f"Channel clustering: {len(mapping)} names -> {len(set(mapping.values()))} clusters, "
+          f"{stats['skipped_blocks']} oversized blocks skipped (>{CLUSTER_MAX_BLOCK_SIZE} keys)")
+    return merged
+
+# ==================== 回看（catchup/playseek）能力探测，按主机缓存 ====================
+CATCHUP_SOURCE_TEMPLATE = "playseek=${(b)yyyyMMddHHmmss}-${(e)yyyyMMddHHmmss}"
+CATCHUP_PROBE_OFFSET = timedelta(hours=2)
+CATCHUP_PROBE_WINDOW = timedelta(minutes=5)
+CATCHUP_PROBE_BYTES = 16384
+
+def url_host(url: str) -> str:
+    try:
+        return urlsplit(url).netloc.lower()
+    except ValueError:
+        return ""
+
+def build_catchup_probe_url(url: str, now: Optional[datetime] = None) -> str:
+    """在原地址上追加一段过去时间窗的 playseek 参数"""
+    end = (now or datetime.now()) - CATCHUP_PROBE_OFFSET
+    begin = end - CATCHUP_PROBE_WINDOW
+    separator = "&" if "?" in url else "?"
+    return f"{url}{separator}playseek={begin:%Y%m%d%H%M%S}-{end:%Y%m%d%H%M%S}"
+
+def looks_like_timeshift_playlist(body: str) -> bool:
+    """忽略 playseek 的源会照常返回直播列表；只有返回带结束标记的点播列表才视为支持回看"""
+    return body.lstrip().startswith("#EXTM3U") and ("#EXT-X-ENDLIST" in body or "#EXT-X-PLAYLIST-TYPE:VOD" in body)
+
+def build_catchup_attributes(url: str, catchup_hosts: Set[str]) -> str:
+    if url_host(url) not in catchup_hosts:
+        return ""
+    separator = "&" if "?" in url else "?"
+    return f" catchup=\"append\" catchup-source=\"{separator}{CATCHUP_SOURCE_TEMPLATE}\""
+
+def load_catchup_cache(file_path: str) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict):
+        return {}
+    # 丢弃手工编辑或损坏的条目
+    return {
+        host: entry for host, entry in cache.items()
+        if isinstance(entry, dict) and isinstance(entry.get("supported"), bool)
+        and isinstance(entry.get("checked_at"), int) and not isinstance(entry.get("checked_at"), bool)
+    }
+
+def save_catchup_cache(file_path: str, cache: Dict[str, Dict[str, Any]]) -> None:
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+async def probe_catchup_support(session, semaphore, url: str) -> bool:
+    """对过去时间窗发起一次小范围 Range 请求，判断主机是否支持 playseek 回看"""
+    async with semaphore:
+        try:
+            headers = {"Range": f"bytes=0-{CATCHUP_PROBE_BYTES - 1}"}
+            async with session.get(build_catchup_probe_url(url), headers=headers, allow_redirects=True) as resp:
+                if resp.status not in (200, 206):
+                    return False
+                body = await resp.content.read(CATCHUP_PROBE_BYTES)
+                return looks_like_timeshift_playlist(body.decode("utf-8", errors="ignore"))
+        except Exception:
+            return False
+
+async def detect_catchup_hosts(session, urls: Iterable[str]) -> Set[str]:
+    """每个主机只探测一个代表地址（优先 m3u8），结果按主机缓存 catchup_cache_ttl_hours 小时"""
+    import asyncio
+
+    host_urls = {}
+    for url in urls:
+        host = url_host(url)
+        if host and (host not in host_urls or (".m3u8" in url and ".m3u8" not in host_urls[host])):
+            host_urls[host] = url
+    cache = load_catchup_cache(CONFIG["catchup_cache"])
+    now = int(time.time())
+    ttl = CONFIG["catchup_cache_ttl_hours"] * 3600
+    pending = {host: url for host, url in host_urls.items() if now - cache.get(host, {}).get("checked_at", 0) > ttl}
+    sem = asyncio.Semaphore(CONFIG["max_parallel"])
+    results = await asyncio.gather(*(probe_catchup_support(session, sem, url) for url in pending.values()))
+    for host, supported in zip(pending, results):
+        cache[host] = {"supported": supported, "checked_at": now}
+    # 已不在播放列表中且已过期的主机不再保留，避免缓存随上游 IP 变化无限增长
+    stale = [host for host, entry in cache.items() if host not in host_urls and now - entry["checked_at"] > ttl]
+    for host in stale:
+        del cache[host]
+    if pending or stale:
+        save_catchup_cache(CONFIG["catchup_cache"], cache)
+    supported_hosts = {host for host in host_urls if cache.get(host, {}).get("supported")}
+    print(f"Catchup probe: {len(supported_hosts)}/{len(host_urls)} hosts support playseek ({len(pending)} probed, {len(host_urls) - len(pending)} cached)")
+    return supported_hosts
+
 # ==================== 原代码的配置与输出函数 ====================
 CONFIG = {
     "timeout": 10,
@@ -451,8 +806,95 @@ CONFIG = {
     "output_m3u": "Internet_iTV.m3u",
     "output_txt": "Internet_iTV.txt",
     "iptv_directory": "IPTV",
-    "logo_base_url": "https://logo.ifanr.dedyn.io/tv"
+    "logo_base_url": "https://logo.ifanr.dedyn.io/tv",
+    "epg_file": "epg.xml.gz",
+    "probe_timeout": 5,
+    "probe_results": "probe_results.json",
+    "serve_port": 8000,
+    "catchup_probe": True,
+    "catchup_cache": "catchup_cache.json",
+    "catchup_cache_ttl_hours": 72,
+    "geo_index_cache": "geo_token_index.json",
+    "metrics_file": "probe_metrics.ring",
+    "metrics_capacity": 1460,
+    "metrics_max_hosts": 50,
+    "prometheus_file": "",
+    "source_urls": [
+        "https://raw.githubusercontent.com/mytv-android/iptv-api/master/output/result.m3u",
+        "https://raw.githubusercontent.com/vbskycn/iptv/master/tv/iptv4.m3u"
+    ],
+    "cctv_channel_file": ".github/workflows/iTV/CCTV.txt",
+    "province_channel_files": [
+        ".github/workflows/iTV/📛4K·8K频道.txt",
+        ".github/workflows/iTV/💰付费频道.txt",
+        ".github/workflows/iTV/🍁数字频道.txt",
+        ".github/workflows/iTV/🍱NewTV频道.txt",
+        ".github/workflows/iTV/🐳iHOT频道.txt",
+        ".github/workflows/iTV/🦜DOX频道.txt",
+        ".github/workflows/iTV/🐌CIBN频道.txt",
+        ".github/workflows/iTV/💾IPTV频道.txt",
+        ".github/workflows/iTV/🦥教育频道.txt",
+        ".github/workflows/iTV/📡卫视频道.txt",
+        ".github/workflows/iTV/🚃重庆频道.txt",
+        ".github/workflows/iTV/🚄四川频道.txt",
+        ".github/workflows/iTV/🚅云南频道.txt",
+        ".github/workflows/iTV/🚈安徽频道.txt",
+        ".github/workflows/iTV/🚝福建频道.txt",
+        ".github/workflows/iTV/🚋甘肃频道.txt",
+        ".github/workflows/iTV/🚌广东频道.txt",
+        ".github/workflows/iTV/🚎广西频道.txt",
+        ".github/workflows/iTV/🚐贵州频道.txt",
+        ".github/workflows/iTV/🚑海南频道.txt",
+        ".github/workflows/iTV/🚒河北频道.txt",
+        ".github/workflows/iTV/🚓河南频道.txt",
+        ".github/workflows/iTV/🚕黑龙江频道.txt",
+        ".github/workflows/iTV/🚗湖北频道.txt",
+        ".github/workflows/iTV/🚙湖南频道.txt",
+        ".github/workflows/iTV/🚚吉林频道.txt",
+        ".github/workflows/iTV/🚂江苏频道.txt",
+        ".github/workflows/iTV/🚛江西频道.txt",
+        ".github/workflows/iTV/🚜辽宁频道.txt",
+        ".github/workflows/iTV/🏎️内蒙古频道.txt",
+        ".github/workflows/iTV/🏍️宁夏频道.txt",
+        ".github/workflows/iTV/🛵青海频道.txt",
+        ".github/workflows/iTV/🦽山东频道.txt",
+        ".github/workflows/iTV/🦼山西频道.txt",
+        ".github/workflows/iTV/🛺陕西频道.txt",
+        ".github/workflows/iTV/🚲上海频道.txt",
+        ".github/workflows/iTV/🛴天津频道.txt",
+        ".github/workflows/iTV/🛹新疆频道.txt",
+        ".github/workflows/iTV/🚞浙江频道.txt",
+        ".github/workflows/iTV/🛩️北京频道.txt",
+        ".github/workflows/iTV/🏍️港澳台频道.txt",
+        ".github/workflows/iTV/🚸少儿频道.txt",
+        ".github/workflows/iTV/🎥咪咕视频.txt",
+        ".github/workflows/iTV/🎬影视剧频道.txt",
+        ".github/workflows/iTV/🎮游戏频道.txt",
+        ".github/workflows/iTV/🎵音乐频道.txt",
+        ".github/workflows/iTV/🏀体育频道.txt",
+        ".github/workflows/iTV/🏛经典剧场.txt",
+        ".github/workflows/iTV/🪁动漫频道.txt",
+        ".github/workflows/iTV/🐼熊猫频道.txt",
+        ".github/workflows/iTV/🗺️直播中国.txt",
+        ".github/workflows/iTV/🦙解说频道.txt",
+        ".github/workflows/iTV/🏮历年春晚.txt"
+    ],
 }
+DEFAULT_CONFIG_KEYS = tuple(CONFIG)
+
+GROUP_ORDER = [
+    "📛4K·8K频道", "📺央视频道", "📡卫视频道", "💰付费频道", "🍁数字频道",
+    "🍱NewTV频道", "🐳iHOT频道", "🦜DOX频道", "🐌CIBN频道", "💾IPTV频道",
+    "🦥教育频道", "🚃重庆频道", "🚄四川频道", "🚅云南频道", "🚈安徽频道",
+    "🚝福建频道", "🚋甘肃频道", "🚌广东频道", "🚎广西频道", "🚐贵州频道",
+    "🚑海南频道", "🚒河北频道", "🚓河南频道", "🚕黑龙江频道", "🚗湖北频道",
+    "🚙湖南频道", "🚚吉林频道", "🚂江苏频道", "🚛江西频道", "🚜辽宁频道",
+    "🏎️内蒙古频道", "🏍️宁夏频道", "🛵青海频道", "🦽山东频道", "🦼山西频道",
+    "🛺陕西频道", "🚲上海频道", "🛴天津频道", "🛹新疆频道", "🚞浙江频道",
+    "🛩️北京频道", "🏍️港澳台频道", "🚸少儿频道", "🎥咪咕视频", "🎬影视剧频道",
+    "🎮游戏频道", "🎵音乐频道", "🏀体育频道", "🏛经典剧场", "🪁动漫频道",
+    "🐼熊猫频道", "🗺️直播中国", "🦙解说频道", "🏮历年春晚", "🐙鯉躍龍門"
+]
 
 def load_cctv_channels(file_path=".github/workflows/iTV/CCTV.txt"):
     cctv_channels = set()
@@ -492,8 +934,9 @@ def normalize_logo_name(channel_name):
 def normalize_cctv_name(channel_name):
     return re.sub(r'CCTV[-]?(\d+)', r'CCTV\1', channel_name)
 
-def generate_output_files(valid_urls, cctv_channels, province_channels, m3u_filename, txt_filename):
-    """生成排序后的 M3U 文件和 TXT 文件（TXT 按照分组结构输出）"""
+def generate_output_files(valid_urls, cctv_channels, province_channels, m3u_filename, txt_filename, catchup_hosts=None):
+    """生成排序后的 M3U 文件和 TXT 文件（TXT 按照分组结构输出）；仅 catchup_hosts 中的主机写入回看属性"""
+    catchup_hosts = catchup_hosts or set()
     cctv_channels_list = []
     province_channels_list = defaultdict(list)
     satellite_channels = []
@@ -607,7 +1050,7 @@ def generate_output_files(valid_urls, cctv_channels, province_channels, m3u_file
 
     # 写入 M3U
     with open(m3u_filename, 'w', encoding='utf-8') as f:
-        f.write("#EXTM3U x-tvg-url=\"https://itv.sspai.net.cn/epg.xml.gz\" catchup=\"append\" catchup-source=\"?playseek=${(b)yyyyMMddHHmmss}-${(e)yyyyMMddHHmmss}\"\n")
+        f.write("#EXTM3U x-tvg-url=\"https://itv.sspai.net.cn/epg.xml.gz\"\n")
         f.write("#EXTINF:-1 tvg-id=\"温馨提示\" tvg-name=\"温馨提示\" tvg-logo=\"https://logo.ifanr.dedyn.io/tv/温馨提示.png\" group-title=\"🦧温馨提示\",温馨提示\n")
         f.write("https://icloud.ifanr.pp.ua/温馨提示.mp4\n")
         f.write("#EXTINF:-1 tvg-id=\"谨防诈骗\" tvg-name=\"谨防诈骗\" tvg-logo=\"https://logo.ifanr.dedyn.io/tv/谨防诈骗.png\" group-title=\"🦧温馨提示\",谨防诈骗\n")
@@ -619,7 +1062,8 @@ def generate_output_files(valid_urls, cctv_channels, province_channels, m3u_file
         
         for channel_info in deduped_channels:
             channel_id = channel_info['channel'].replace('-', '')
-            f.write(f"#EXTINF:-1 tvg-name=\"{channel_id}\" tvg-logo=\"{channel_info['logo']}\" group-title=\"{channel_info['group_title']}\",{channel_info['channel']}\n")
+            catchup_attrs = build_catchup_attributes(channel_info['url'], catchup_hosts)
+            f.write(f"#EXTINF:-1 tvg-name=\"{channel_id}\" tvg-logo=\"{channel_info['logo']}\" group-title=\"{channel_info['group_title']}\"{catchup_attrs},{channel_info['channel']}\n")
             f.write(f"{channel_info['url']}\n")
             
     print(f"🎉 Generated M3U file: {m3u_filename}")
@@ -632,21 +1076,7 @@ def generate_output_files(valid_urls, cctv_channels, province_channels, m3u_file
         for channel_info in deduped_channels:
             grouped_channels[channel_info['group_title']].append(channel_info)
         
-        group_order = [
-            "📛4K·8K频道", "📺央视频道", "📡卫视频道", "💰付费频道", "🍁数字频道",
-            "🍱NewTV频道", "🐳iHOT频道", "🦜DOX频道", "🐌CIBN频道", "💾IPTV频道",
-            "🦥教育频道", "🚃重庆频道", "🚄四川频道", "🚅云南频道", "🚈安徽频道",
-            "🚝福建频道", "🚋甘肃频道", "🚌广东频道", "🚎广西频道", "🚐贵州频道",
-            "🚑海南频道", "🚒河北频道", "🚓河南频道", "🚕黑龙江频道", "🚗湖北频道",
-            "🚙湖南频道", "🚚吉林频道", "🚂江苏频道", "🚛江西频道", "🚜辽宁频道",
-            "🏎️内蒙古频道", "🏍️宁夏频道", "🛵青海频道", "🦽山东频道", "🦼山西频道",
-            "🛺陕西频道", "🚲上海频道", "🛴天津频道", "🛹新疆频道", "🚞浙江频道",
-            "🛩️北京频道", "🏍️港澳台频道", "🚸少儿频道", "🎥咪咕视频", "🎬影视剧频道",
-            "🎮游戏频道", "🎵音乐频道", "🏀体育频道", "🏛经典剧场", "🪁动漫频道",
-            "🐼熊猫频道", "🗺️直播中国", "🦙解说频道", "🏮历年春晚", "🐙鯉躍龍門"
-        ]
-        
-        for group in group_order:
+        for group in GROUP_ORDER:
             if group in grouped_channels and grouped_channels[group]:
                 f.write(f"{group},#genre#\n")
                 channels = sorted(grouped_channels[group], key=lambda x: x['channel'])
@@ -654,7 +1084,7 @@ def generate_output_files(valid_urls, cctv_channels, province_channels, m3u_file
                     f.write(f"{ch['channel']},{ch['url']}\n")
         
         for group, channels in grouped_channels.items():
-            if group not in group_order and channels:
+            if group not in GROUP_ORDER and channels:
                 f.write(f"{group},#genre#\n")
                 channels = sorted(channels, key=lambda x: x['channel'])
                 for ch in channels:
@@ -666,8 +1096,12 @@ def generate_output_files(valid_urls, cctv_channels, province_channels, m3u_file
 
 # ==================== 主函数 ====================
 async def main(file_urls, cctv_channel_file, province_channel_files):
+    import asyncio
+    import aiohttp
+
     cctv_channels = load_cctv_channels(cctv_channel_file)
     province_channels = load_province_channels(province_channel_files)
+    known_channel_names = set(cctv_channels).union(*province_channels.values())
 
     connector = aiohttp.TCPConnector(limit=CONFIG["max_parallel"]*2)
     timeout = aiohttp.ClientTimeout(total=CONFIG["timeout"])
@@ -689,75 +1123,509 @@ async def main(file_urls, cctv_channel_file, province_channel_files):
                 tasks.append(read_and_test_file(session, sem, url, is_m3u=False))
         results = await asyncio.gather(*tasks)
     
-    all_entries = []
-    for res in results:
-        all_entries.extend(res)
+        all_entries = []
+        for res in results:
+            all_entries.extend(res)
     
-    deduped = deduplicate_candidate_entries(all_entries)
-    print(f"Total entries after dedup: {len(deduped)}")
+        deduped = deduplicate_candidate_entries(all_entries)
+        print(f"Total entries after dedup: {len(deduped)}")
+        deduped = merge_channel_clusters(deduped, known_channel_names)
+        print(f"Total entries after channel clustering: {len(deduped)}")
+
+        catchup_hosts = set()
+        if CONFIG["catchup_probe"]:
+            catchup_hosts = await detect_catchup_hosts(session, [entry["url"] for entry in deduped])
 
     valid_urls = [(entry["channel"], entry["url"], None) for entry in deduped]
-    generate_output_files(valid_urls, cctv_channels, province_channels, CONFIG["output_m3u"], CONFIG["output_txt"])
+    generate_output_files(valid_urls, cctv_channels, province_channels, CONFIG["output_m3u"], CONFIG["output_txt"], catchup_hosts)
+
+# ==================== 流地址连通性探测 ====================
+async def probe_stream_url(session, semaphore, url: str) -> Dict[str, Any]:
+    """请求流地址并读取首个数据块，记录状态码与首包延迟"""
+    async with semaphore:
+        start = time.perf_counter()
+        status = None
+        ok = False
+        try:
+            async with session.get(url, allow_redirects=True) as resp:
+                status = resp.status
+                if resp.status < 400:
+                    await resp.content.read(1024)
+                    ok = True
+        except Exception:
+            pass
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        return {"url": url, "ok": ok, "status": status, "latency_ms": latency_ms}
+
+async def probe_stream_urls(urls: Iterable[str]) -> List[Dict[str, Any]]:
+    import asyncio
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(limit=CONFIG["max_parallel"]*2)
+    timeout = aiohttp.ClientTimeout(total=CONFIG["probe_timeout"])
+    async with aiohttp.ClientSession(cookie_jar=None, timeout=timeout, connector=connector) as session:
+        sem = asyncio.Semaphore(CONFIG["max_parallel"])
+        return await asyncio.gather(*(probe_stream_url(session, sem, url) for url in dict.fromkeys(urls)))
+
+# ==================== 探测指标：列式定长环形时序文件与 Prometheus 导出 ====================
+METRICS_MAGIC = b"ITVM"
+METRICS_VERSION = 1
+METRICS_HEADER_FORMAT = "<4sHIII"  # magic, version, capacity, head, count
+METRIC_HELP = {
+    "iptv_group_urls": "URLs published in the group",
+    "iptv_group_live_urls": "URLs in the group that answered the probe",
+    "iptv_group_latency_ms": "Probe latency of live URLs in the group",
+    "iptv_host_urls": "Probed URLs served by the host",
+    "iptv_host_failure_ratio": "Share of the host's URLs that failed the probe",
+    "iptv_probe_urls": "Total probed URLs",
+    "iptv_probe_live_urls": "Total live URLs",
+    "iptv_probe_latency_ms": "Probe latency of all live URLs",
+}
+LATENCY_QUANTILES = (0.5, 0.9, 0.99)
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩百分位；空列表返回 NaN"""
+    if not sorted_values:
+        return float("nan")
+    rank = min(len(sorted_values), max(1, math.ceil(q * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+def format_series_name(metric: str, **labels: str) -> str:
+    if not labels:
+        return metric
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in labels.values())
+    body = ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped))
+    return f"{metric}{{{body}}}"
+
+def aggregate_probe_metrics(entries, probe_results) -> Dict[str, float]:
+    """按分组（播放列表 group-title）与主机汇总探测结果，返回 {序列名: 数值}"""
+    results_by_url = {r["url"]: r for r in probe_results}
+    group_results = defaultdict(list)
+    for entry in entries:
+        result = results_by_url.get(entry["url"])
+        if result is not None:
+            group_results[entry.get("source_group_title") or "🐙鯉躍龍門"].append(result)
+    host_results = defaultdict(list)
+    for result in results_by_url.values():
+        host_results[url_host(result["url"])].append(result)
+    # 主机数随上游变化，只保留 URL 最多的前 metrics_max_hosts 个，其余并入 host="other"，使序列数有界
+    ranked_hosts = sorted(host_results, key=lambda host: (-len(host_results[host]), host))
+    for host in ranked_hosts[CONFIG["metrics_max_hosts"]:]:
+        host_results["other"].extend(host_results.pop(host))
+
+    sample = {}
+    def add_latency_quantiles(metric, results, **labels):
+        latencies = sorted(r["latency_ms"] for r in results if r["ok"])
+        for q in LATENCY_QUANTILES:
+            sample[format_series_name(metric, **labels, quantile=str(q))] = percentile(latencies, q)
+
+    for group, results in group_results.items():
+        sample[format_series_name("iptv_group_urls", group=group)] = len(results)
+        sample[format_series_name("iptv_group_live_urls", group=group)] = sum(1 for r in results if r["ok"])
+        add_latency_quantiles("iptv_group_latency_ms", results, group=group)
+    for host, results in host_results.items():
+        sample[format_series_name("iptv_host_urls", host=host)] = len(results)
+        sample[format_series_name("iptv_host_failure_ratio", host=host)] = round(sum(1 for r in results if not r["ok"]) / len(results), 4)
+    sample["iptv_probe_urls"] = len(results_by_url)
+    sample["iptv_probe_live_urls"] = sum(1 for r in results_by_url.values() if r["ok"])
+    add_latency_quantiles("iptv_probe_latency_ms", results_by_url.values())
+    return sample
+
+def load_metrics_columns(columns_path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(columns_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(meta, dict) or not isinstance(meta.get("columns"), list) or len(meta["columns"]) != len(meta.get("last_seen", ())):
+        return None
+    return meta
+
+def append_metrics_sample(file_path: str, sample: Dict[str, float], timestamp: float, capacity: int) -> None:
+    """
+    追加一次运行的指标到环形时序文件。
+    文件布局：头部 + 时间戳列 + 每个序列一列，每列 capacity 个 float64；
+    序列名、各列最后写入的运行序号与总运行数存于 <file>.columns.json。
+    每次只覆写 head 槽位；连续 capacity 次未出现的序列已整列为 NaN，在此回收，
+    配合 aggregate_probe_metrics 对主机序列的上限，文件大小与每次开销都有界，与历史长度无关。
+    """
+    import struct
+
+    header_size = struct.calcsize(METRICS_HEADER_FORMAT)
+    columns_path = f"{file_path}.columns.json"
+    meta = load_metrics_columns(columns_path)
+    header = None
+    if meta is not None:
+        try:
+            with open(file_path, 'rb') as f:
+                header = struct.unpack(METRICS_HEADER_FORMAT, f.read(header_size))
+            if header[0] != METRICS_MAGIC or header[1] != METRICS_VERSION:
+                header = None
+            elif os.path.getsize(file_path) != header_size + (len(meta["columns"]) + 1) * header[2] * 8:
+                header = None
+        except (OSError, struct.error):
+            header = None
+    if header is None:
+        # 缺失或损坏时重建
+        meta = {"runs": 0, "columns": [], "last_seen": []}
+        header = (METRICS_MAGIC, METRICS_VERSION, capacity, 0, 0)
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        with open(file_path, 'wb') as f:
+            f.write(struct.pack(METRICS_HEADER_FORMAT, *header))
+            f.write(struct.pack("<d", float("nan")) * capacity)
+    if header[2] != capacity:
+        print(f"Warning: metrics_capacity is {capacity} but {file_path} was created with {header[2]}; "
+              f"keeping {header[2]} (delete the file to rebuild with the new capacity)")
+    _, _, capacity, head, count = header
+    run = meta["runs"] + 1
+    column_bytes = capacity * 8
+
+    expired = {i for i, (name, last_seen) in enumerate(zip(meta["columns"], meta["last_seen"]))
+               if name not in sample and last_seen <= run - capacity}
+    if expired:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        tmp_path = f"{file_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data[:header_size + column_bytes])
+            for i in range(len(meta["columns"])):
+                if i not in expired:
+                    offset = header_size + (i + 1) * column_bytes
+                    f.write(data[offset:offset + column_bytes])
+        os.replace(tmp_path, file_path)
+        meta["columns"] = [name for i, name in enumerate(meta["columns"]) if i not in expired]
+        meta["last_seen"] = [seen for i, seen in enumerate(meta["last_seen"]) if i not in expired]
+
+    known = set(meta["columns"])
+    new_columns = sorted(name for name in sample if name not in known)
+    with open(file_path, 'r+b') as f:
+        if new_columns:
+            f.seek(0, os.SEEK_END)
+            f.write(struct.pack("<d", float("nan")) * (capacity * len(new_columns)))
+            meta["columns"].extend(new_columns)
+            meta["last_seen"].extend([run] * len(new_columns))
+        values = [timestamp] + [sample.get(name, float("nan")) for name in meta["columns"]]
+        for position, value in enumerate(values):
+            f.seek(header_size + position * column_bytes + head * 8)
+            f.write(struct.pack("<d", float(value)))
+        f.seek(0)
+        f.write(struct.pack(METRICS_HEADER_FORMAT, METRICS_MAGIC, METRICS_VERSION, capacity, (head + 1) % capacity, min(count + 1, capacity)))
+    meta["runs"] = run
+    meta["last_seen"] = [run if name in sample else seen for name, seen in zip(meta["columns"], meta["last_seen"])]
+    with open(columns_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+def load_metrics_history(file_path: str) -> Tuple[List[float], Dict[str, List[float]]]:
+    """按时间顺序读出整个环形缓冲（仅供查看，构建流程不调用）；缺失或损坏时返回空历史"""
+    import struct
+
+    meta = load_metrics_columns(f"{file_path}.columns.json")
+    if meta is None:
+        return [], {}
+    header_size = struct.calcsize(METRICS_HEADER_FORMAT)
+    try:
+        with open(file_path, 'rb') as f:
+            magic, version, capacity, head, count = struct.unpack(METRICS_HEADER_FORMAT, f.read(header_size))
+            data = f.read()
+    except (OSError, struct.error):
+        return [], {}
+    if magic != METRICS_MAGIC or version != METRICS_VERSION or len(data) != (len(meta["columns"]) + 1) * capacity * 8:
+        return [], {}
+    order = [(head - count + i) % capacity for i in range(count)]
+    def read_column(position):
+        values = struct.unpack_from(f"<{capacity}d", data, position * capacity * 8)
+        return [values[slot] for slot in order]
+    return read_column(0), {name: read_column(i + 1) for i, name in enumerate(meta["columns"])}
+
+def write_prometheus_metrics(file_path: str, sample: Dict[str, float], timestamp: float) -> None:
+    """以 Prometheus 文本格式写出本次指标（先写临时文件再替换，供 textfile collector 读取）"""
+    by_metric = defaultdict(list)
+    for series, value in sample.items():
+        by_metric[series.split("{", 1)[0]].append((series, value))
+    lines = []
+    for metric in sorted(by_metric):
+        lines.append(f"# HELP {metric} {METRIC_HELP.get(metric, metric)}")
+        lines.append(f"# TYPE {metric} gauge")
+        for series, value in sorted(by_metric[metric]):
+            lines.append(f"{series} {'NaN' if value != value else repr(float(value))}")
+    lines.append("# HELP iptv_probe_timestamp_seconds Time of the probe run")
+    lines.append("# TYPE iptv_probe_timestamp_seconds gauge")
+    lines.append(f"iptv_probe_timestamp_seconds {timestamp:.0f}")
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, file_path)
+
+# ==================== 命令行入口（按子命令懒加载依赖） ====================
+COMMAND_MODULES = {
+    "build": ("asyncio", "aiohttp"),
+    "probe": ("asyncio", "aiohttp", "struct"),
+    "metrics": ("struct",),
+    "epg": ("gzip", "xml.etree.ElementTree"),
+    "bench": ("tempfile",),
+    "serve": ("http.server",),
+    "check": (),
+    "groups": (),
+}
+# 非标准库依赖对应的 pip 包名
+PIP_PACKAGES = {"aiohttp": "aiohttp"}
+
+def apply_config_file(path: str) -> None:
+    """用 JSON 配置文件覆盖 CONFIG 中的同名键"""
+    with open(path, 'r', encoding='utf-8') as f:
+        overrides = json.load(f)
+    if not isinstance(overrides, dict):
+        raise ValueError("配置文件顶层必须是对象")
+    CONFIG.update(overrides)
+
+def validate_config(config: Dict[str, Any]) -> List[str]:
+    problems = []
+    for key in ("timeout", "max_parallel", "probe_timeout", "serve_port", "catchup_cache_ttl_hours", "metrics_capacity", "metrics_max_hosts"):
+        value = config.get(key)
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value <= 0:
+            problems.append(f"{key}: 需要正数，当前为 {value!r}")
+    source_urls = config.get("source_urls")
+    if not isinstance(source_urls, list) or not source_urls:
+        problems.append("source_urls: 至少需要一个订阅源")
+    else:
+        for url in source_urls:
+            if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+                problems.append(f"source_urls: 非 http(s) 地址 {url!r}")
+            elif not url.endswith(('.m3u', '.m3u8', '.txt')):
+                problems.append(f"source_urls: 无法识别格式（需 .m3u/.m3u8/.txt）{url}")
+    if not os.path.exists(str(config.get("cctv_channel_file"))):
+        problems.append(f"cctv_channel_file: 文件不存在 {config.get('cctv_channel_file')}")
+    for file_path in config.get("province_channel_files") or []:
+        if not os.path.exists(file_path):
+            problems.append(f"province_channel_files: 文件不存在 {file_path}")
+    unknown = sorted(set(config) - set(DEFAULT_CONFIG_KEYS))
+    if unknown:
+        problems.append(f"未知配置项: {', '.join(unknown)}")
+    return problems
+
+def read_playlist_entries(file_path: str):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    if file_path.endswith(('.m3u', '.m3u8')):
+        return extract_urls_from_m3u(content)
+    return extract_urls_from_txt(content)
+
+def cmd_build(args) -> int:
+    import asyncio
+
+    asyncio.run(main(CONFIG["source_urls"], CONFIG["cctv_channel_file"], CONFIG["province_channel_files"]))
+    return 0
+
+def cmd_probe(args) -> int:
+    import asyncio
+
+    input_file = args.input or CONFIG["output_m3u"]
+    entries = read_playlist_entries(input_file)
+    urls = [entry["url"] for entry in entries]
+    if args.limit:
+        urls = urls[:args.limit]
+    results = asyncio.run(probe_stream_urls(urls))
+    output_file = args.output or CONFIG["probe_results"]
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=1)
+    live = [r for r in results if r["ok"]]
+    latencies = sorted(r["latency_ms"] for r in live)
+    median = latencies[len(latencies) // 2] if latencies else 0
+    print(f"Probed {len(results)} URLs from {input_file}: {len(live)} live, median latency {median} ms")
+    print(f"Probe results written to: {output_file}")
+
+    if args.limit and not args.record:
+        print("Partial probe (--limit): metrics history and Prometheus file left unchanged, pass --record to record anyway")
+        return 0
+    timestamp = time.time()
+    sample = aggregate_probe_metrics(entries, results)
+    append_metrics_sample(CONFIG["metrics_file"], sample, timestamp, CONFIG["metrics_capacity"])
+    print(f"Appended {len(sample)} series to metrics history: {CONFIG['metrics_file']}")
+    prometheus_file = args.prometheus or CONFIG["prometheus_file"]
+    if prometheus_file:
+        write_prometheus_metrics(prometheus_file, sample, timestamp)
+        print(f"Prometheus metrics written to: {prometheus_file}")
+    return 0
+
+def cmd_metrics(args) -> int:
+    timestamps, history = load_metrics_history(CONFIG["metrics_file"])
+    if not timestamps:
+        print(f"No metrics history yet: {CONFIG['metrics_file']}")
+        return 0
+    recent = slice(-args.last, None)
+    print("series\t" + "\t".join(datetime.fromtimestamp(ts).strftime("%m-%d %H:%M") for ts in timestamps[recent]))
+    for series in sorted(history):
+        if args.match and args.match not in series:
+            continue
+        values = ("-" if value != value else f"{value:g}" for value in history[series][recent])
+        print(f"{series}\t" + "\t".join(values))
+    return 0
+
+def cmd_epg(args) -> int:
+    import gzip
+    import xml.etree.ElementTree as ET
+
+    epg_file = args.epg or CONFIG["epg_file"]
+    opener = gzip.open if epg_file.endswith(".gz") else open
+    epg_names = set()
+    with opener(epg_file, 'rb') as f:
+        for _, element in ET.iterparse(f):
+            if element.tag == "channel":
+                for display_name in element.iter("display-name"):
+                    if display_name.text:
+                        epg_names.add(normalize_text_for_match(display_name.text))
+                element.clear()
+            elif element.tag == "programme":
+                element.clear()
+    playlist_file = args.input or CONFIG["output_m3u"]
+    channels = sorted({entry["channel"] for entry in read_playlist_entries(playlist_file)})
+    missing = [ch for ch in channels if normalize_text_for_match(ch.replace('-', '')) not in epg_names]
+    print(f"EPG {epg_file}: {len(epg_names)} channels; playlist {playlist_file}: {len(channels)} channels, {len(missing)} without EPG")
+    for ch in missing[:args.show]:
+        print(f"  - {ch}")
+    return 0
+
+def cmd_bench(args) -> int:
+    import tempfile
+
+    inputs = args.input or [CONFIG["output_m3u"]]
+    cctv_channels = load_cctv_channels(CONFIG["cctv_channel_file"])
+    province_channels = load_province_channels(CONFIG["province_channel_files"])
+    known_channel_names = set(cctv_channels).union(*province_channels.values())
+    stage_timings = defaultdict(list)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            entries = []
+            for file_path in inputs:
+                entries.extend(read_playlist_entries(file_path))
+            stage_timings["parse"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            deduped = deduplicate_candidate_entries(entries)
+            stage_timings["dedup"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            deduped = merge_channel_clusters(deduped, known_channel_names)
+            stage_timings["cluster"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            valid_urls = [(entry["channel"], entry["url"], None) for entry in deduped]
+            generate_output_files(valid_urls, cctv_channels, province_channels,
+                                  os.path.join(tmp_dir, "bench.m3u"), os.path.join(tmp_dir, "bench.txt"))
+            stage_timings["output"].append(time.perf_counter() - start)
+    print(f"Benchmark over {len(entries)} entries, best of {args.repeat}:")
+    for stage, timings in stage_timings.items():
+        print(f"  {stage:<8} {min(timings) * 1000:9.1f} ms")
+    return 0
+
+def cmd_serve(args) -> int:
+    import functools
+    import http.server
+
+    port = args.port or CONFIG["serve_port"]
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=args.directory)
+    with http.server.ThreadingHTTPServer((args.host, port), handler) as server:
+        print(f"Serving {os.path.abspath(args.directory)} on http://{args.host}:{port}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+def cmd_check(args) -> int:
+    problems = validate_config(CONFIG)
+    for problem in problems:
+        print(f"✗ {problem}")
+    if problems:
+        return 1
+    print(f"✓ 配置有效：{len(CONFIG['source_urls'])} 个订阅源，{len(CONFIG['province_channel_files'])} 个分组文件")
+    return 0
+
+def cmd_groups(args) -> int:
+    group_files = {os.path.basename(path).replace(".txt", ""): path for path in CONFIG["province_channel_files"]}
+    for group in GROUP_ORDER:
+        file_path = group_files.get(group)
+        if file_path:
+            print(f"{group}\t{file_path}{'' if os.path.exists(file_path) else '（缺失）'}")
+        else:
+            print(group)
+    return 0
+
+COMMAND_HANDLERS = {
+    "build": cmd_build,
+    "probe": cmd_probe,
+    "metrics": cmd_metrics,
+    "epg": cmd_epg,
+    "bench": cmd_bench,
+    "serve": cmd_serve,
+    "check": cmd_check,
+    "groups": cmd_groups,
+}
+
+def build_arg_parser():
+    import argparse
+
+    def positive_int(value: str) -> int:
+        try:
+            number = int(value)
+        except ValueError:
+            number = 0
+        if number <= 0:
+            raise argparse.ArgumentTypeError(f"需要正整数，当前为 {value!r}")
+        return number
+
+    parser = argparse.ArgumentParser(description="IPTV 订阅源聚合与发布工具")
+    parser.add_argument("--config", help="JSON 配置文件，覆盖内置 CONFIG 中的同名键")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("build", help="拉取订阅源并生成 M3U/TXT（默认）")
+    probe = subparsers.add_parser("probe", help="探测播放列表中流地址的连通性")
+    probe.add_argument("--input", help="待探测的播放列表，默认为 output_m3u")
+    probe.add_argument("--output", help="探测结果 JSON，默认为 probe_results")
+    probe.add_argument("--limit", type=positive_int, help="最多探测的地址数")
+    probe.add_argument("--prometheus", help="额外写出 Prometheus 文本格式指标文件")
+    probe.add_argument("--record", action="store_true", help="配合 --limit 时仍写入指标历史（默认只记录完整探测）")
+    metrics = subparsers.add_parser("metrics", help="查看探测指标历史")
+    metrics.add_argument("--match", help="只显示包含该子串的序列")
+    metrics.add_argument("--last", type=positive_int, default=8, help="显示最近的运行次数")
+    epg = subparsers.add_parser("epg", help="检查播放列表频道的 EPG 覆盖情况")
+    epg.add_argument("--epg", help="EPG 文件（.xml 或 .xml.gz），默认为 epg_file")
+    epg.add_argument("--input", help="播放列表，默认为 output_m3u")
+    epg.add_argument("--show", type=int, default=20, help="列出缺少 EPG 的频道数")
+    bench = subparsers.add_parser("bench", help="离线基准测试解析/去重/聚类/输出各阶段")
+    bench.add_argument("--input", action="append", help="本地播放列表，可重复指定，默认为 output_m3u")
+    bench.add_argument("--repeat", type=positive_int, default=3)
+    serve = subparsers.add_parser("serve", help="在本地以 HTTP 提供生成的文件")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=positive_int, help="默认为 serve_port")
+    serve.add_argument("--directory", default=".")
+    subparsers.add_parser("check", help="校验配置")
+    subparsers.add_parser("groups", help="列出输出分组及其频道文件")
+    return parser
+
+def cli(argv: Optional[List[str]] = None) -> int:
+    script_ms = (time.perf_counter() - _SCRIPT_IMPORT_START) * 1000
+    args = build_arg_parser().parse_args(argv)
+    command = args.command or "build"
+    if args.config:
+        try:
+            apply_config_file(args.config)
+        except (OSError, ValueError) as e:
+            print(f"✗ --config {args.config}: {e}")
+            return 1
+
+    start = time.perf_counter()
+    for module_name in COMMAND_MODULES[command]:
+        try:
+            importlib.import_module(module_name)
+        except ImportError as e:
+            hint = f"，请先安装：pip install {PIP_PACKAGES[module_name]}" if module_name in PIP_PACKAGES else f"（{e}）"
+            print(f"[{command}] 缺少依赖 {module_name}{hint}", file=sys.stderr)
+            return 1
+    deps_ms = (time.perf_counter() - start) * 1000
+    print(f"[{command}] 导入耗时 {script_ms + deps_ms:.1f} ms（脚本 {script_ms:.1f} ms，子命令依赖 {deps_ms:.1f} ms）", file=sys.stderr)
+    return COMMAND_HANDLERS[command](args)
 
 if __name__ == "__main__":
-    file_urls = [
-        "https://raw.githubusercontent.com/mytv-android/iptv-api/master/output/result.m3u",
-        "https://raw.githubusercontent.com/vbskycn/iptv/master/tv/iptv4.m3u"
-    ]
-    cctv_channel_file = ".github/workflows/iTV/CCTV.txt"
-    province_channel_files = [
-        ".github/workflows/iTV/📛4K·8K频道.txt",
-        ".github/workflows/iTV/💰付费频道.txt",
-        ".github/workflows/iTV/🍁数字频道.txt",
-        ".github/workflows/iTV/🍱NewTV频道.txt",
-        ".github/workflows/iTV/🐳iHOT频道.txt",
-        ".github/workflows/iTV/🦜DOX频道.txt",
-        ".github/workflows/iTV/🐌CIBN频道.txt",
-        ".github/workflows/iTV/💾IPTV频道.txt",
-        ".github/workflows/iTV/🦥教育频道.txt",
-        ".github/workflows/iTV/📡卫视频道.txt",
-        ".github/workflows/iTV/🚃重庆频道.txt",
-        ".github/workflows/iTV/🚄四川频道.txt",
-        ".github/workflows/iTV/🚅云南频道.txt",
-        ".github/workflows/iTV/🚈安徽频道.txt",
-        ".github/workflows/iTV/🚝福建频道.txt",
-        ".github/workflows/iTV/🚋甘肃频道.txt",
-        ".github/workflows/iTV/🚌广东频道.txt",
-        ".github/workflows/iTV/🚎广西频道.txt",
-        ".github/workflows/iTV/🚐贵州频道.txt",
-        ".github/workflows/iTV/🚑海南频道.txt",
-        ".github/workflows/iTV/🚒河北频道.txt",
-        ".github/workflows/iTV/🚓河南频道.txt",
-        ".github/workflows/iTV/🚕黑龙江频道.txt",
-        ".github/workflows/iTV/🚗湖北频道.txt",
-        ".github/workflows/iTV/🚙湖南频道.txt",
-        ".github/workflows/iTV/🚚吉林频道.txt",
-        ".github/workflows/iTV/🚂江苏频道.txt",
-        ".github/workflows/iTV/🚛江西频道.txt",
-        ".github/workflows/iTV/🚜辽宁频道.txt",
-        ".github/workflows/iTV/🏎️内蒙古频道.txt",
-        ".github/workflows/iTV/🏍️宁夏频道.txt",
-        ".github/workflows/iTV/🛵青海频道.txt",
-        ".github/workflows/iTV/🦽山东频道.txt",
-        ".github/workflows/iTV/🦼山西频道.txt",
-        ".github/workflows/iTV/🛺陕西频道.txt",
-        ".github/workflows/iTV/🚲上海频道.txt",
-        ".github/workflows/iTV/🛴天津频道.txt",
-        ".github/workflows/iTV/🛹新疆频道.txt",
-        ".github/workflows/iTV/🚞浙江频道.txt",
-        ".github/workflows/iTV/🛩️北京频道.txt",
-        ".github/workflows/iTV/🏍️港澳台频道.txt",
-        ".github/workflows/iTV/🚸少儿频道.txt",
-        ".github/workflows/iTV/🎥咪咕视频.txt",
-        ".github/workflows/iTV/🎬影视剧频道.txt",
-        ".github/workflows/iTV/🎮游戏频道.txt",
-        ".github/workflows/iTV/🎵音乐频道.txt",
-        ".github/workflows/iTV/🏀体育频道.txt",
-        ".github/workflows/iTV/🏛经典剧场.txt",
-        ".github/workflows/iTV/🪁动漫频道.txt",
-        ".github/workflows/iTV/🐼熊猫频道.txt",
-        ".github/workflows/iTV/🗺️直播中国.txt",
-        ".github/workflows/iTV/🦙解说频道.txt",
-        ".github/workflows/iTV/🏮历年春晚.txt"
-    ]
-    asyncio.run(main(file_urls, cctv_channel_file, province_channel_files))
+    sys.exit(cli())